@@ -0,0 +1,61 @@
+"""
+Postgres-backed OTP store.
+
+OTPs used to live in a module-level dict, which breaks as soon as the service
+runs more than one worker: /auth/send-otp and /auth/login can be served by
+different processes. Keeping them in the `otp_codes` table makes them visible
+to every worker, and gives us a real expiry.
+"""
+
+import os
+import asyncpg
+
+OTP_TTL_SECONDS = int(os.getenv("OTP_TTL_SECONDS", 600))
+
+CREATE_OTP_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS otp_codes (
+        phone TEXT PRIMARY KEY,
+        otp TEXT NOT NULL,
+        expires_at TIMESTAMPTZ NOT NULL
+    )
+"""
+
+
+async def save_otp(db: asyncpg.Connection, phone: str, otp: str) -> None:
+    """Store (or replace) the pending OTP for a phone number."""
+    await db.execute(
+        """
+        INSERT INTO otp_codes (phone, otp, expires_at)
+        VALUES ($1, $2, NOW() + make_interval(secs => $3))
+        ON CONFLICT (phone) DO UPDATE
+        SET otp = EXCLUDED.otp, expires_at = EXCLUDED.expires_at
+        """,
+        phone,
+        otp,
+        OTP_TTL_SECONDS,
+    )
+
+
+async def consume_otp(db: asyncpg.Connection, phone: str, otp: str) -> bool:
+    """
+    Atomically check and delete an OTP.
+
+    Returns True only if the OTP matched and had not expired. Because the
+    check and the delete are a single statement, the same code can't be
+    used twice even if two workers receive the login concurrently.
+    """
+    consumed = await db.fetchval(
+        """
+        DELETE FROM otp_codes
+        WHERE phone = $1 AND otp = $2 AND expires_at > NOW()
+        RETURNING phone
+        """,
+        phone,
+        otp,
+    )
+    return consumed is not None
+
+
+async def purge_expired_otps(db: asyncpg.Connection) -> None:
+    """Drop OTPs that expired without being used."""
+    await db.execute("DELETE FROM otp_codes WHERE expires_at <= NOW()")
@@ -0,0 +1,267 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when either:
+- it carries `X-Profile-Token` with a token listed in PROFILE_ADMIN_TOKENS, or
+- it is picked by PROFILE_SAMPLE_RATE (0.0 - 1.0).
+
+A profiled request gets a cProfile stack profile plus a span breakdown of
+the instrumented calls (pool acquire, queries, JWT signing, SMS sends).
+The last PROFILE_BUFFER_SIZE profiles are kept in a per-worker ring buffer
+and can be downloaded from /admin/profiles (those requests are never
+profiled themselves).
+
+When neither setting is present the middleware is not installed at all and
+`span()` returns a shared no-op context manager, so requests pay nothing.
+
+Note: cProfile sees everything the event loop runs while the request is in
+flight, including other concurrent requests. Only one request per worker is
+stack-profiled at a time; overlapping ones still get their spans recorded.
+"""
+
+import cProfile
+import hmac
+import io
+import itertools
+import logging
+import marshal
+import os
+import pstats
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile-Token"
+
+# Never profiled: the admin endpoints reuse PROFILE_HEADER for auth, and
+# profiling them would evict the very profiles being fetched
+UNPROFILED_PATH_PREFIX = "/admin/profiles"
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+_NO_SPAN = nullcontext()
+
+
+def admin_tokens() -> list:
+    return [t.strip() for t in os.getenv("PROFILE_ADMIN_TOKENS", "").split(",") if t.strip()]
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    if not token:
+        return False
+    # Compare bytes: compare_digest rejects non-ASCII str, and header values are latin-1
+    try:
+        token_bytes = token.encode("latin-1")
+    except UnicodeEncodeError:
+        return False
+    return any(hmac.compare_digest(token_bytes, allowed.encode()) for allowed in admin_tokens())
+
+
+# ────────────────────────────── PROFILE RECORD ──────────────────────────────
+
+class RequestProfile:
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str, trigger: str):
+        # Unique across workers, so a lookup that lands on another worker is a clean 404
+        self.id = f"{os.getpid()}-{next(self._ids)}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = 0.0
+        self.status_code = None
+        self.spans = []
+        self.pstats_text = None
+        self.pstats_raw = None
+
+    def add_span(self, name: str, detail: Optional[str], start: float, end: float) -> None:
+        self.spans.append({
+            "name": name,
+            "detail": detail,
+            "start_ms": round((start - self._t0) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        })
+
+    def finish(self, profiler: Optional[cProfile.Profile]) -> None:
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        if profiler is None:
+            return
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        self.pstats_text = out.getvalue()
+        # Same format as cProfile's dump_stats(), loadable with pstats / snakeviz
+        profiler.create_stats()
+        self.pstats_raw = marshal.dumps(profiler.stats)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "pid": os.getpid(),
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "span_count": len(self.spans),
+            "has_stack_profile": self.pstats_raw is not None,
+        }
+
+    def detail(self) -> dict:
+        return {**self.summary(), "spans": self.spans, "pstats": self.pstats_text}
+
+
+# Per-worker ring buffer of finished profiles
+profiles: deque = deque(maxlen=int(os.getenv("PROFILE_BUFFER_SIZE", 20)))
+
+
+def get_profile(profile_id: str) -> Optional[RequestProfile]:
+    for profile in profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+# ────────────────────────────── SPANS ──────────────────────────────
+
+class _Span:
+    __slots__ = ("profile", "name", "detail", "start")
+
+    def __init__(self, profile: RequestProfile, name: str, detail: Optional[str]):
+        self.profile = profile
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add_span(self.name, self.detail, self.start, time.perf_counter())
+        return False
+
+
+def is_active() -> bool:
+    return _current_profile.get() is not None
+
+
+def span(name: str, detail: Optional[str] = None):
+    """Time a block if the current request is being profiled; otherwise a no-op."""
+    profile = _current_profile.get()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name, detail)
+
+
+def _query_label(query: str) -> str:
+    return " ".join(query.split())[:80]
+
+
+class TracedConnection:
+    """asyncpg connection proxy that records a span for every query."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def fetch(self, query, *args, **kwargs):
+        with span("fetch", _query_label(query)):
+            return await self._conn.fetch(query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        with span("fetchrow", _query_label(query)):
+            return await self._conn.fetchrow(query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        with span("fetchval", _query_label(query)):
+            return await self._conn.fetchval(query, *args, **kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        with span("execute", _query_label(query)):
+            return await self._conn.execute(query, *args, **kwargs)
+
+
+# ────────────────────────────── MIDDLEWARE ──────────────────────────────
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware so unprofiled requests only pay for the trigger check."""
+
+    def __init__(self, app, sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.header = PROFILE_HEADER.lower().encode()
+        self._stack_profiler_busy = False
+
+    def _trigger(self, scope) -> Optional[str]:
+        for key, value in scope["headers"]:
+            if key == self.header:
+                return "header" if is_admin_token(value.decode("latin-1")) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNPROFILED_PATH_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"], trigger)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+            await send(message)
+
+        profiler = None
+        if not self._stack_profiler_busy:
+            self._stack_profiler_busy = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            if profiler is not None:
+                profiler.disable()
+                self._stack_profiler_busy = False
+            profile.finish(profiler)
+            profiles.append(profile)
+            logger.info(
+                "Profiled %s %s: %.1f ms, %d spans (profile id=%s)",
+                profile.method, profile.path, profile.duration_ms, len(profile.spans), profile.id,
+            )
+
+
+def setup_profiling(app: FastAPI) -> None:
+    """
+    Install the profiling middleware if it is enabled.
+
+    Call after setup_cors() so profiling wraps the CORS handling too.
+    """
+    sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    if not admin_tokens() and sample_rate <= 0:
+        logger.info("Request profiling disabled")
+        return
+
+    app.add_middleware(ProfilingMiddleware, sample_rate=sample_rate)
+    logger.info(
+        "Request profiling enabled (sample_rate=%s, admin tokens=%d, buffer=%d)",
+        sample_rate, len(admin_tokens()), profiles.maxlen,
+    )
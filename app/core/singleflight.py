@@ -0,0 +1,54 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call and its
+result (or exception). Nothing is cached: once the call finishes, the next
+caller starts a fresh one.
+
+Cancellation: the caller that started the call (the leader) awaits it
+directly, so cancelling the leader cancels the call too. That matters when
+the call runs on the leader's own pooled connection, which is released as
+soon as the leader's request ends. Followers only wait through
+asyncio.shield(). If the leader was cancelled, they retry and one of them
+becomes the new leader. If a follower is cancelled, nobody else notices.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        while True:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, key=key: self._forget(key, t))
+                self.calls += 1
+                return await task
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if task.cancelled() and not _cancelling(asyncio.current_task()):
+                    # The leader went away; start over, possibly as the new leader
+                    self.coalesced -= 1
+                    continue
+                raise
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+
+def _cancelling(task) -> bool:
+    # Task.cancelling() is Python 3.11+; older versions can't tell, assume not
+    cancelling = getattr(task, "cancelling", None)
+    return bool(cancelling and cancelling())
@@ -0,0 +1,385 @@
+"""
+OTP SMS delivery with per-provider circuit breakers and failover.
+
+Providers are tried in the order given by SMS_PROVIDERS (default
+"africastalking,console"). Each call is bounded by the provider's own
+timeout, and each provider sits behind a circuit breaker so an outage
+fails fast instead of tying up every /auth/send-otp request for the full
+SDK timeout.
+
+Breaker state is kept per worker process; that is intentional, every
+worker learns about an outage from its own traffic within a few calls.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from .profiling import span
+
+# Optional Africa's Talking SDK (provider is skipped if not available)
+try:
+    import africastalking
+except Exception:
+    africastalking = None
+
+logger = logging.getLogger(__name__)
+
+
+class SMSDeliveryError(Exception):
+    """Raised by a provider when a message could not be delivered."""
+
+
+# ────────────────────────────── CIRCUIT BREAKER ──────────────────────────────
+
+class BreakerTicket:
+    """Admission handed out by `CircuitBreaker.allow_request()`; pass it back with the outcome."""
+
+    __slots__ = ("generation", "probe")
+
+    def __init__(self, generation: int, probe: bool):
+        self.generation = generation
+        self.probe = probe
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker.
+
+    - closed: calls go through; outcomes are recorded in a sliding window of
+      the last `window_size` calls. Once at least `min_calls` are recorded and
+      the failure rate reaches `failure_rate_threshold`, the breaker opens.
+    - open: calls are rejected until `cooldown_seconds` have passed.
+    - half_open: up to `half_open_probes` trial calls are let through. If they
+      all succeed the breaker closes; any failure re-opens it.
+
+    Every state change starts a new generation. An outcome only counts if
+    its ticket was issued in the current generation, so calls that were
+    still in flight when the breaker tripped can neither re-open it (and
+    restart the cooldown) nor pass for a half-open probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window_size: int = 20,
+        min_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        cooldown_seconds: float = 30.0,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+
+        self.state = self.CLOSED
+        self._generation = 0
+        self._outcomes = deque(maxlen=window_size)  # True = success
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.times_opened = 0
+
+    def allow_request(self) -> Optional[BreakerTicket]:
+        """Return a ticket if the call may go ahead, None if it must be skipped."""
+        if self.state == self.OPEN:
+            if self._clock() - self._opened_at < self.cooldown_seconds:
+                return None
+            self._to_half_open()
+
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                return None
+            self._probes_in_flight += 1
+            return BreakerTicket(self._generation, probe=True)
+
+        return BreakerTicket(self._generation, probe=False)
+
+    def record_success(self, ticket: BreakerTicket) -> None:
+        if ticket.generation != self._generation:
+            return
+        if ticket.probe:
+            self._probes_in_flight -= 1
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._to_closed()
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self, ticket: BreakerTicket) -> None:
+        if ticket.generation != self._generation:
+            return
+        if ticket.probe:
+            self._to_open()
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.min_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._to_open()
+
+    def record_cancelled(self, ticket: BreakerTicket) -> None:
+        """The call was abandoned by the caller; free its probe slot without judging the provider."""
+        if ticket.generation == self._generation and ticket.probe:
+            self._probes_in_flight -= 1
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate(), 3),
+            "window_calls": len(self._outcomes),
+            "times_opened": self.times_opened,
+        }
+
+    def _to_open(self) -> None:
+        logger.warning("SMS circuit breaker opened (failure rate %.0f%%)", self.failure_rate() * 100)
+        self._transition(self.OPEN)
+        self._opened_at = self._clock()
+        self.times_opened += 1
+
+    def _to_half_open(self) -> None:
+        self._transition(self.HALF_OPEN)
+
+    def _to_closed(self) -> None:
+        logger.info("SMS circuit breaker closed")
+        self._transition(self.CLOSED)
+        self._outcomes.clear()
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+
+# ────────────────────────────── PROVIDERS ──────────────────────────────
+
+class SMSProvider:
+    """Base provider. `send` must raise on failure; the dispatcher enforces `timeout`."""
+
+    name = "base"
+
+    def __init__(self, timeout: float = 5.0):
+        self.timeout = timeout
+
+    def is_configured(self) -> bool:
+        return True
+
+    async def send(self, phone: str, message: str) -> None:
+        raise NotImplementedError
+
+
+class ThreadedSMSProvider(SMSProvider):
+    """
+    Base for providers whose SDK blocks.
+
+    `_send_blocking` runs on the provider's own pool of `max_threads`
+    threads, never the loop's default executor: a timed-out call can't be
+    interrupted, so a hung SDK may only tie up these threads, not the ones
+    DNS lookups and new DB connections rely on. Subclasses should also
+    bound the SDK's own I/O by `timeout` so stuck threads free up.
+    """
+
+    def __init__(self, timeout: float = 5.0, max_threads: int = 4):
+        super().__init__(timeout)
+        self.max_threads = max_threads
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix=f"sms-{self.name}")
+
+    async def send(self, phone: str, message: str) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._send_blocking, phone, message)
+
+    def _send_blocking(self, phone: str, message: str) -> None:
+        raise NotImplementedError
+
+
+class AfricasTalkingProvider(ThreadedSMSProvider):
+    name = "africastalking"
+
+    def __init__(self, timeout: float = 5.0):
+        super().__init__(timeout, max_threads=int(os.getenv("SMS_SDK_THREADS", 4)))
+        self.username = os.getenv("AT_USERNAME") or os.getenv("AFRICASTALKING_USERNAME")
+        self.api_key = os.getenv("AT_API_KEY") or os.getenv("AFRICASTALKING_APIKEY")
+        self.from_number = os.getenv("AT_FROM") or os.getenv("AFRICASTALKING_FROM")
+        self._sms = None
+
+    def is_configured(self) -> bool:
+        if africastalking is None:
+            logger.debug("Africa's Talking SDK not available")
+            return False
+        if not self.username or not self.api_key:
+            logger.warning("Africa's Talking credentials missing")
+            return False
+        return True
+
+    def _send_blocking(self, phone: str, message: str) -> None:
+        if self._sms is None:
+            africastalking.initialize(self.username, self.api_key)
+            self._sms = africastalking.SMS
+
+        # Correct Africa's Talking SDK call: message first, recipients list second.
+        # `timeout` is handed to requests (connect and read), so the thread
+        # gives up around the same time the dispatcher stops waiting.
+        recipients = [phone]
+        if self.from_number:
+            response = self._sms.send(message, recipients, sender=self.from_number, timeout=self.timeout)
+        else:
+            response = self._sms.send(message, recipients, timeout=self.timeout)
+        logger.info("Africa's Talking SMS sent successfully: %s", response)
+
+
+class ConsoleProvider(SMSProvider):
+    """Local sink: logs the message instead of sending it. Never fails."""
+
+    name = "console"
+
+    async def send(self, phone: str, message: str) -> None:
+        logger.info("SMS (console) → %s: %s", phone, message)
+
+
+class FakeSMSProvider(SMSProvider):
+    """
+    Local fake for tests and outage drills.
+
+    `latency` seconds are slept before every send and a fraction
+    `error_rate` of sends raise SMSDeliveryError. Both can be changed at
+    runtime to simulate a provider degrading and recovering.
+    """
+
+    def __init__(self, name: str = "fake", timeout: float = 5.0, latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(timeout)
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent = []
+
+    async def send(self, phone: str, message: str) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            raise SMSDeliveryError(f"{self.name}: injected failure")
+        self.sent.append((phone, message))
+
+
+# ────────────────────────────── DISPATCHER ──────────────────────────────
+
+class SMSDispatcher:
+    """Sends through the first provider whose breaker is closed and that succeeds in time."""
+
+    def __init__(self, providers: list, breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker):
+        self.providers = providers
+        self.breakers = {p.name: breaker_factory() for p in providers}
+        self.delivered = {p.name: 0 for p in providers}
+        self.failed = {p.name: 0 for p in providers}
+        self.undelivered = 0
+
+    async def send(self, phone: str, message: str) -> Optional[str]:
+        """Return the name of the provider that delivered the message, or None."""
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            ticket = breaker.allow_request()
+            if ticket is None:
+                logger.debug("SMS provider %s skipped: breaker %s", provider.name, breaker.state)
+                continue
+
+            try:
+                with span("send_sms", provider.name):
+                    await asyncio.wait_for(provider.send(phone, message), timeout=provider.timeout)
+            except asyncio.CancelledError:
+                breaker.record_cancelled(ticket)
+                raise
+            except Exception as e:
+                breaker.record_failure(ticket)
+                self.failed[provider.name] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning("SMS provider %s timed out after %.1fs", provider.name, provider.timeout)
+                else:
+                    logger.warning("SMS provider %s failed: %s", provider.name, e)
+                continue
+
+            breaker.record_success(ticket)
+            self.delivered[provider.name] += 1
+            return provider.name
+
+        self.undelivered += 1
+        logger.error("SMS to %s not delivered: all providers failed or unavailable", phone)
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "providers": {
+                p.name: {
+                    "timeout_seconds": p.timeout,
+                    "delivered": self.delivered[p.name],
+                    "failed": self.failed[p.name],
+                    "breaker": self.breakers[p.name].snapshot(),
+                }
+                for p in self.providers
+            },
+            "undelivered": self.undelivered,
+        }
+
+
+# ────────────────────────────── CONFIG ──────────────────────────────
+
+PROVIDER_CLASSES = {
+    AfricasTalkingProvider.name: AfricasTalkingProvider,
+    ConsoleProvider.name: ConsoleProvider,
+}
+
+
+def _provider_timeout(name: str) -> float:
+    default = float(os.getenv("SMS_TIMEOUT_SECONDS", 5))
+    return float(os.getenv(f"SMS_{name.upper()}_TIMEOUT_SECONDS", default))
+
+
+def _breaker_from_env() -> CircuitBreaker:
+    return CircuitBreaker(
+        window_size=int(os.getenv("SMS_BREAKER_WINDOW", 20)),
+        min_calls=int(os.getenv("SMS_BREAKER_MIN_CALLS", 5)),
+        failure_rate_threshold=float(os.getenv("SMS_BREAKER_FAILURE_RATE", 0.5)),
+        cooldown_seconds=float(os.getenv("SMS_BREAKER_COOLDOWN_SECONDS", 30)),
+        half_open_probes=int(os.getenv("SMS_BREAKER_HALF_OPEN_PROBES", 1)),
+    )
+
+
+def build_dispatcher_from_env() -> SMSDispatcher:
+    providers = []
+    for name in os.getenv("SMS_PROVIDERS", "africastalking,console").split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        cls = PROVIDER_CLASSES.get(name)
+        if cls is None:
+            logger.warning("Unknown SMS provider %r ignored", name)
+            continue
+        provider = cls(timeout=_provider_timeout(name))
+        if provider.is_configured():
+            providers.append(provider)
+    return SMSDispatcher(providers, breaker_factory=_breaker_from_env)
+
+
+_dispatcher: Optional[SMSDispatcher] = None
+
+
+def get_sms_dispatcher() -> SMSDispatcher:
+    """Process-wide dispatcher, built on first use (app.main loads .env before that)."""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = build_dispatcher_from_env()
+    return _dispatcher
@@ -0,0 +1,194 @@
+"""
+In-memory admin dashboard stats, refreshed in the background.
+
+/users/stats serves a pre-serialized snapshot, so the request path never
+touches `users` or `service_requests`. A background task keeps the snapshot
+fresh:
+
+- every STATS_REFRESH_SECONDS (default 30) it fetches only rows whose
+  `created_at` is newer than the last watermark and folds them in;
+- every STATS_FULL_REFRESH_SECONDS (default 600) it rebuilds from scratch.
+  This catches what an append-only watermark can't see: number plates set
+  through another worker, deleted requests, and rows committed late with an
+  older `created_at`.
+
+The refresher runs on its own connection, not the request pool, so a full
+scan never makes requests wait for a pool slot (app.core.workers budgets
+for it). Workers start their first refresh at a random offset within
+STATS_STARTUP_JITTER_SECONDS so they don't all scan at once.
+
+Each worker keeps its own copy; it's a rebuildable cache, never the source
+of truth.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", 30))
+STATS_FULL_REFRESH_SECONDS = float(os.getenv("STATS_FULL_REFRESH_SECONDS", 600))
+STATS_STARTUP_JITTER_SECONDS = float(os.getenv("STATS_STARTUP_JITTER_SECONDS", 5))
+
+# (label, lowest count, highest count or None)
+REQUEST_COUNT_BUCKETS = [
+    ("0", 0, 0),
+    ("1", 1, 1),
+    ("2-5", 2, 5),
+    ("6-10", 6, 10),
+    ("11+", 11, None),
+]
+
+USERS_SQL = "SELECT id, phone, role, number_plate, created_at FROM users"
+REQUESTS_SQL = """
+    SELECT customer_phone, COUNT(*) AS request_count, MAX(created_at) AS latest
+    FROM service_requests
+    {where}
+    GROUP BY customer_phone
+"""
+
+
+def _bucket(count: int) -> str:
+    for label, low, high in REQUEST_COUNT_BUCKETS:
+        if count >= low and (high is None or count <= high):
+            return label
+    return REQUEST_COUNT_BUCKETS[-1][0]
+
+
+class StatsCache:
+    def __init__(self):
+        self._reset()
+        self.snapshot_json: Optional[bytes] = None
+
+    def _reset(self) -> None:
+        # user id -> {"phone", "role", "day", "has_plate"}
+        self.users = {}
+        # customer phone -> number of service requests
+        self.request_counts = Counter()
+        self.users_watermark: Optional[datetime] = None
+        self.requests_watermark: Optional[datetime] = None
+
+    # ────────────────────────────── REFRESH ──────────────────────────────
+
+    async def refresh(self, conn: asyncpg.Connection, full: bool = False) -> None:
+        started = time.perf_counter()
+        if full:
+            self._reset()
+
+        if self.users_watermark is None:
+            user_rows = await conn.fetch(USERS_SQL)
+        else:
+            user_rows = await conn.fetch(USERS_SQL + " WHERE created_at > $1", self.users_watermark)
+
+        if self.requests_watermark is None:
+            request_rows = await conn.fetch(REQUESTS_SQL.format(where=""))
+        else:
+            request_rows = await conn.fetch(
+                REQUESTS_SQL.format(where="WHERE created_at > $1"), self.requests_watermark
+            )
+
+        self.apply_users(user_rows)
+        self.apply_request_counts(request_rows)
+        self.rebuild_snapshot()
+        logger.debug(
+            "Stats %s refresh: %d new users, %d request groups in %.1f ms",
+            "full" if full else "incremental",
+            len(user_rows), len(request_rows), (time.perf_counter() - started) * 1000,
+        )
+
+    def apply_users(self, rows) -> None:
+        for row in rows:
+            created_at = row["created_at"]
+            self.users[row["id"]] = {
+                "phone": row["phone"],
+                "role": row["role"] or "unknown",
+                "day": created_at.date().isoformat() if created_at else "unknown",
+                "has_plate": bool(row["number_plate"]),
+            }
+            if created_at and (self.users_watermark is None or created_at > self.users_watermark):
+                self.users_watermark = created_at
+
+    def apply_request_counts(self, rows) -> None:
+        for row in rows:
+            self.request_counts[row["customer_phone"]] += row["request_count"]
+            latest = row["latest"]
+            if latest and (self.requests_watermark is None or latest > self.requests_watermark):
+                self.requests_watermark = latest
+
+    def note_profile_update(self, user_id: int, number_plate: Optional[str]) -> None:
+        """Reflect a number plate change made through this worker right away."""
+        user = self.users.get(user_id)
+        if user is None:
+            return
+        user["has_plate"] = bool(number_plate)
+        self.rebuild_snapshot()
+
+    # ────────────────────────────── SNAPSHOT ──────────────────────────────
+
+    def rebuild_snapshot(self) -> None:
+        signups = defaultdict(Counter)
+        drivers = with_plate = with_requests = 0
+        distribution = Counter({label: 0 for label, _, _ in REQUEST_COUNT_BUCKETS})
+
+        for user in self.users.values():
+            signups[user["day"]][user["role"]] += 1
+            if user["role"] != "driver":
+                continue
+            drivers += 1
+            with_plate += user["has_plate"]
+            count = self.request_counts.get(user["phone"], 0)
+            with_requests += count > 0
+            distribution[_bucket(count)] += 1
+
+        snapshot = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "totals": {
+                "users": len(self.users),
+                "drivers": drivers,
+                "drivers_with_number_plate": with_plate,
+                "drivers_without_number_plate": drivers - with_plate,
+                "drivers_with_requests": with_requests,
+                "drivers_without_requests": drivers - with_requests,
+            },
+            "signups_by_day": {day: dict(roles) for day, roles in sorted(signups.items())},
+            "driver_request_count_distribution": dict(distribution),
+        }
+        # Serialized once here so the endpoint just hands out bytes
+        self.snapshot_json = json.dumps(snapshot).encode()
+
+    # ────────────────────────────── BACKGROUND TASK ──────────────────────────────
+
+    async def run(self, dsn: str) -> None:
+        """Refresh forever on a dedicated connection; reconnects after errors."""
+        conn: Optional[asyncpg.Connection] = None
+        last_full = 0.0
+        try:
+            await asyncio.sleep(random.uniform(0, STATS_STARTUP_JITTER_SECONDS))
+            while True:
+                full = time.monotonic() - last_full >= STATS_FULL_REFRESH_SECONDS
+                try:
+                    if conn is None or conn.is_closed():
+                        conn = await asyncpg.connect(dsn)
+                    await self.refresh(conn, full=full)
+                    if full:
+                        last_full = time.monotonic()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception("Stats refresh failed: %s", e)
+                await asyncio.sleep(STATS_REFRESH_SECONDS)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+
+
+stats_cache = StatsCache()
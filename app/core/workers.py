@@ -0,0 +1,73 @@
+"""
+Multi-worker serving helpers.
+
+The service can run as several OS processes (gunicorn + UvicornWorker, or
+`uvicorn --workers N`). Every worker runs its own lifespan and therefore owns
+its own asyncpg pool, so the Postgres connection budget has to be split
+between workers instead of being granted to each one.
+
+Per-process state audit:
+- asyncpg pool: one per worker, sized by `pool_size_per_worker()`.
+- Stats refresher (app.core.stats_cache): one dedicated connection per
+  worker, outside the pool so background scans never block requests.
+- OTP codes: shared through the `otp_codes` table (see app.core.otp_store),
+  so /auth/send-otp and /auth/login may land on different workers.
+- Anything else kept in memory must be safe to hold per worker
+  (i.e. a cache that can be rebuilt, never the source of truth).
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Total connections this service may hold across ALL workers.
+# The default matches asyncpg's own single-process pool size.
+DEFAULT_DB_POOL_MAX_TOTAL = 10
+
+# Connections each worker holds outside its pool (the stats refresher)
+DEDICATED_CONNECTIONS_PER_WORKER = 1
+
+
+def worker_count() -> int:
+    """
+    Number of worker processes serving the app.
+
+    WEB_CONCURRENCY is read by both uvicorn and gunicorn.conf.py, so it is
+    the single source of truth for the worker count.
+    """
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        logger.warning("Invalid WEB_CONCURRENCY=%r, assuming 1 worker", os.getenv("WEB_CONCURRENCY"))
+        return 1
+
+
+def db_pool_max_total() -> int:
+    return int(os.getenv("DB_POOL_MAX_TOTAL", DEFAULT_DB_POOL_MAX_TOTAL))
+
+
+def max_workers() -> int:
+    """Most workers the connection budget can serve (each needs a pool connection plus its dedicated ones)."""
+    return max(1, db_pool_max_total() // (1 + DEDICATED_CONNECTIONS_PER_WORKER))
+
+
+def pool_size_per_worker() -> int:
+    """
+    Max asyncpg pool size for this worker.
+
+    DB_POOL_MAX_TOTAL is divided evenly across workers, and each worker's
+    share minus its dedicated connections becomes the pool. The whole
+    service never opens more than DB_POOL_MAX_TOTAL Postgres connections as
+    long as there are no more workers than max_workers() (gunicorn.conf.py
+    enforces this).
+    """
+    total = db_pool_max_total()
+    workers = worker_count()
+    if workers > max_workers():
+        logger.warning(
+            "WEB_CONCURRENCY=%d is more than DB_POOL_MAX_TOTAL=%d allows; "
+            "each worker still opens %d connections, exceeding the budget",
+            workers, total, 1 + DEDICATED_CONNECTIONS_PER_WORKER,
+        )
+    return max(1, total // workers - DEDICATED_CONNECTIONS_PER_WORKER)
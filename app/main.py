@@ -1,13 +1,29 @@
 # motofix-auth-service/app/main.py
 
 import os
+import asyncio
 import logging
 from fastapi import FastAPI
 import asyncpg
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-from .routers import auth, users
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    def load_dotenv(*args, **kwargs):
+        logging.warning("python-dotenv not installed; skipping load_dotenv()")
+
+# Before the imports below: app.core reads SMS_*, AT_*, PROFILE_* and
+# DB_POOL_* settings at import time or on a worker's first request
+load_dotenv()
+
+from .routers import admin, auth, users
 from app.core.cors import setup_cors
+from app.core.profiling import setup_profiling
+from app.core.sms import get_sms_dispatcher
+from app.core.stats_cache import stats_cache
+from app.core.otp_store import CREATE_OTP_TABLE_SQL, purge_expired_otps
+from app.core.workers import pool_size_per_worker, worker_count
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,14 +33,26 @@ logger = logging.getLogger("motofix-auth")
 
 pool: asyncpg.Pool
 
+# Arbitrary constant key so only one worker at a time runs the startup migrations
+MIGRATION_LOCK_KEY = 7_246_801
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global pool
+    # Each worker owns a pool; split the connection budget across workers
+    pool_size = pool_size_per_worker()
     # Use Render's internal DATABASE_URL
-    pool = await asyncpg.create_pool(dsn=os.getenv("DATABASE_URL"))
+    pool = await asyncpg.create_pool(
+        dsn=os.getenv("DATABASE_URL"),
+        min_size=pool_size,
+        max_size=pool_size,
+    )
+    logger.info(f"✅ DB pool ready: {pool_size} connections (workers={worker_count()})")
 
     # ── Schema migrations ──────────────────────────────────────────────
-    async with pool.acquire() as conn:
+    # Workers start concurrently; serialize the DDL behind an advisory lock
+    async with pool.acquire() as conn, conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_KEY)
         # Add number_plate column if it doesn't exist (idempotent migration)
         await conn.execute("""
             ALTER TABLE users
@@ -35,9 +63,22 @@ async def lifespan(app: FastAPI):
             ALTER TABLE users
             ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT NOW()
         """)
+        # Shared OTP store so any worker can verify a code issued by another
+        await conn.execute(CREATE_OTP_TABLE_SQL)
+        await purge_expired_otps(conn)
+        # Lets the stats refresher read only rows past its watermark
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)
+        """)
     logger.info("✅ DB schema migrations applied")
 
+    # Background refresh of the /users/stats snapshot, on its own connection
+    stats_task = asyncio.create_task(stats_cache.run(os.getenv("DATABASE_URL")))
+
     yield
+    stats_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await stats_task
     await pool.close()
 
 app = FastAPI(
@@ -51,17 +92,22 @@ app = FastAPI(
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    # Per-worker view: each process reports its own counters and breaker state
+    return {"pid": os.getpid(), "sms": get_sms_dispatcher().snapshot()}
+
 # ────────────────────────────── CORS (CENTRALIZED) ──────────────────────────────
 # Import and apply centralized CORS configuration from app.core.cors
 setup_cors(app)
 
+# Opt-in request profiling (no-op unless PROFILE_ADMIN_TOKENS / PROFILE_SAMPLE_RATE are set)
+setup_profiling(app)
+
 # ────────────────────────────── STARTUP EVENT ──────────────────────────────
 
 @app.on_event("startup")
 async def startup_event():
-    for route in app.routes:
-        if hasattr(route, "path") and route.path == "/health":
-            print(f"Route: {route.path} - {route.name}")
     logger.info("=" * 70)
     logger.info("🚀 MOTOFIX Auth Service Starting")
     logger.info("=" * 70)
@@ -75,6 +121,7 @@ def get_pool():
 auth_router = auth.router
 app.include_router(auth_router, prefix="/auth")
 app.include_router(users.router)
+app.include_router(admin.router)
 
 # ────────────────────────────── GLOBAL EXCEPTION HANDLER ──────────────────────────────
 
@@ -0,0 +1,52 @@
+# app/routers/admin.py
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from typing import Optional
+
+from ..core import profiling
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+# ────────────────────────────── DEPENDENCIES ──────────────────────────────
+
+async def require_profile_admin(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.is_admin_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+# ────────────────────────────── ENDPOINTS ──────────────────────────────
+
+@router.get("/profiles", dependencies=[Depends(require_profile_admin)])
+async def list_profiles():
+    """
+    Summaries of the profiles kept by the worker that answers, newest first.
+    Ids are "<pid>-<n>"; fetching one from a different worker returns 404.
+    """
+    return [p.summary() for p in reversed(profiling.profiles)]
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_profile_admin)])
+async def get_profile(profile_id: str):
+    """
+    Span breakdown plus the top of the cProfile report for one request.
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.detail()
+
+
+@router.get("/profiles/{profile_id}/pstats", dependencies=[Depends(require_profile_admin)])
+async def download_profile(profile_id: str):
+    """
+    Raw cProfile stats, loadable with `pstats.Stats(path)` or snakeviz.
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None or profile.pstats_raw is None:
+        raise HTTPException(status_code=404, detail="Stack profile not found")
+    return Response(
+        content=profile.pstats_raw,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'},
+    )
@@ -3,6 +3,7 @@
 import os
 import random
 import logging
+from contextlib import asynccontextmanager
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
@@ -10,19 +11,15 @@ from typing import Optional
 import asyncpg
 from jose import jwt, JWTError
 
-# Optional Africa's Talking SDK (fallback to console if not available)
-try:
-    import africastalking
-except Exception:
-    africastalking = None
+from ..core.otp_store import OTP_TTL_SECONDS, consume_otp, save_otp
+from ..core.sms import get_sms_dispatcher
+from ..core.profiling import TracedConnection, is_active as profiling_active, span
+from ..core.singleflight import SingleFlight
 
 router = APIRouter(tags=["Auth"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-# In-memory OTP store (simple & effective for MVP)
-otp_store = {}
-
 
 # ────────────────────────────── SCHEMAS ──────────────────────────────
 
@@ -51,9 +48,26 @@ class UserOut(BaseModel):
 
 # ────────────────────────────── DEPENDENCIES ──────────────────────────────
 
-async def get_db() -> asyncpg.Connection:
+@asynccontextmanager
+async def db_connection():
+    """Borrow a pooled connection for just the enclosed block."""
     from ..main import pool  # Reuse pool from main.py
-    async with pool.acquire() as conn:
+    if not profiling_active():
+        async with pool.acquire() as conn:
+            yield conn
+        return
+
+    # Profiled request: time the acquire and every query on this connection
+    with span("get_db acquire"):
+        conn = await pool.acquire()
+    try:
+        yield TracedConnection(conn)
+    finally:
+        await pool.release(conn)
+
+
+async def get_db() -> asyncpg.Connection:
+    async with db_connection() as conn:
         yield conn
 
 
@@ -61,39 +75,8 @@ async def get_db() -> asyncpg.Connection:
 
 def create_jwt(data: dict) -> str:
     from ..utils import create_jwt as utils_create_jwt
-    return utils_create_jwt(data)
-
-
-async def send_sms_via_africastalking(phone: str, message: str) -> bool:
-    if africastalking is None:
-        logging.debug("Africa's Talking SDK not available")
-        return False
-
-    username = os.getenv("AT_USERNAME") or os.getenv("AFRICASTALKING_USERNAME")
-    api_key = os.getenv("AT_API_KEY") or os.getenv("AFRICASTALKING_APIKEY")
-    from_number = os.getenv("AT_FROM") or os.getenv("AFRICASTALKING_FROM")
-
-    if not username or not api_key:
-        logging.warning("Africa's Talking credentials missing")
-        return False
-
-    try:
-        africastalking.initialize(username, api_key)
-        sms = africastalking.SMS
-
-        # Correct Africa's Talking SDK call: message first, recipients list second
-        recipients = [phone]
-        if from_number:
-            response = sms.send(message, recipients, sender=from_number)
-        else:
-            response = sms.send(message, recipients)
-
-        logging.info("Africa's Talking SMS sent successfully: %s", response)
-        return True
-
-    except Exception as e:
-        logging.exception("Failed to send SMS via Africa's Talking: %s", e)
-        return False
+    with span("create_jwt"):
+        return utils_create_jwt(data)
 
 
 # ────────────────────────────── ENDPOINTS ──────────────────────────────
@@ -107,14 +90,18 @@ async def send_otp(req: PhoneRequest):
         raise HTTPException(status_code=422, detail="Invalid phone format. Use +256XXXXXXXXX")
 
     otp = f"{random.randint(0, 999999):06d}"
-    otp_store[phone] = otp
-    msg = f"Your MOTOFIX OTP is {otp}. Valid for 10 minutes."
+    # Stored in Postgres so the login can be verified by any worker.
+    # The connection goes back to the pool before the (possibly slow) SMS send.
+    async with db_connection() as db:
+        await save_otp(db, phone, otp)
+    msg = f"Your MOTOFIX OTP is {otp}. Valid for {OTP_TTL_SECONDS // 60} minutes."
 
-    sent = await send_sms_via_africastalking(phone, msg)
+    # Providers are tried in order behind circuit breakers (see app.core.sms)
+    provider = await get_sms_dispatcher().send(phone, msg)
+    logging.info("OTP SMS for %s delivered via: %s", phone, provider or "none")
 
-    # Always print/log OTP to console for testing (remove in production)
+    # Always log OTP for testing (remove in production)
     logging.info("OTP for %s: %s", phone, otp)
-    print(f"\nOTP → {phone}: {otp}\n")
 
     # For development/testing return the OTP in the response
     return {"message": "OTP sent successfully", "otp": otp}
@@ -124,8 +111,8 @@ async def send_otp(req: PhoneRequest):
 async def login(req: OTPVerify, response: Response, db: asyncpg.Connection = Depends(get_db)):
     logging.info(f"🔐 [POST /auth/login] Login attempt for phone: {req.phone}")
     
-    stored_otp = otp_store.get(req.phone)
-    if stored_otp != req.otp:
+    # Check-and-delete in one statement: a code can only ever be used once
+    if not await consume_otp(db, req.phone, req.otp):
         logging.warning(f"❌ [POST /auth/login] Invalid OTP for phone: {req.phone}")
         raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
@@ -151,9 +138,6 @@ async def login(req: OTPVerify, response: Response, db: asyncpg.Connection = Dep
         logging.info(f"ℹ️ [POST /auth/login] Existing user found: {req.phone}")
         user_id = user_row["id"]
 
-    # Clean up OTP
-    otp_store.pop(req.phone, None)
-
     # Generate JWT — include phone so downstream services can authorise without a users-table lookup
     token = create_jwt({"sub": str(user_id), "role": req.role or "driver", "phone": req.phone})
     logging.debug(f"✅ [POST /auth/login] JWT created for user_id: {user_id}")
@@ -179,7 +163,30 @@ async def login(req: OTPVerify, response: Response, db: asyncpg.Connection = Dep
     return {"access_token": token, "user": dict(user_row) if user_row else None}
 
 
-async def _get_user_from_token(token: str, db: asyncpg.Connection):
+# Coalesces concurrent lookups of the same user id into one query (per worker)
+_user_lookups = SingleFlight()
+
+USER_BY_ID_QUERY = "SELECT id, phone, full_name, role, number_plate FROM users WHERE id = $1"
+
+
+async def _fetch_user_row(user_id: int, db: Optional[asyncpg.Connection] = None):
+    """
+    Look up a user, sharing the query with concurrent lookups of the same id.
+
+    Without `db`, only the leader borrows a pool connection, so coalesced
+    followers never hold a slot. Callers that already hold the request's
+    connection pass it instead, so they never take a second one.
+    """
+    async def lookup():
+        if db is not None:
+            return await db.fetchrow(USER_BY_ID_QUERY, user_id)
+        async with db_connection() as conn:
+            return await conn.fetchrow(USER_BY_ID_QUERY, user_id)
+
+    return await _user_lookups.do(user_id, lookup)
+
+
+async def _get_user_from_token(token: str, db: Optional[asyncpg.Connection] = None):
     secret_key = os.getenv("SECRET_KEY")
     algorithm = os.getenv("ALGORITHM", "HS256")
 
@@ -196,9 +203,8 @@ async def _get_user_from_token(token: str, db: asyncpg.Connection):
         logging.error(f"❌ [Token Decode] JWT decode failed: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    query = "SELECT id, phone, full_name, role, number_plate FROM users WHERE id = $1"
     logging.debug(f"🔍 [DB Query] Looking up user with id={user_id}")
-    user_row = await db.fetchrow(query, int(user_id))
+    user_row = await _fetch_user_row(int(user_id), db)
     if not user_row:
         logging.error(f"❌ [DB Query] User not found with id={user_id}")
         raise HTTPException(status_code=404, detail="User not found")
@@ -207,7 +213,7 @@ async def _get_user_from_token(token: str, db: asyncpg.Connection):
     return dict(user_row)
 
 
-async def get_current_user(request: Request, db: asyncpg.Connection = Depends(get_db)):
+def _token_from_request(request: Request) -> str:
     # Prefer Authorization header, fallback to httpOnly cookie named 'access_token'
     token = None
     auth_header = request.headers.get("authorization")
@@ -230,6 +236,19 @@ async def get_current_user(request: Request, db: asyncpg.Connection = Depends(ge
         logging.error("❌ [get_current_user] No token found in request")
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    return token
+
+
+async def get_current_user(request: Request):
+    """Authenticated user; borrows a pool connection only if it leads the lookup."""
+    token = _token_from_request(request)
+    logging.debug(f"🔐 [get_current_user] Verifying token...")
+    return await _get_user_from_token(token)
+
+
+async def get_current_user_with_db(request: Request, db: asyncpg.Connection = Depends(get_db)):
+    """Authenticated user for endpoints that also depend on get_db; reuses that connection."""
+    token = _token_from_request(request)
     logging.debug(f"🔐 [get_current_user] Verifying token...")
     return await _get_user_from_token(token, db)
 
@@ -1,11 +1,12 @@
 # app/routers/users.py
 
 import logging
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from typing import Optional
 import asyncpg
 
-from .auth import get_current_user, get_db
+from .auth import get_current_user, get_current_user_with_db, get_db
+from ..core.stats_cache import stats_cache
 
 router = APIRouter(tags=["Users"])
 
@@ -28,7 +29,7 @@ class UserProfileUpdate(BaseModel):
 @router.get("/users/")
 async def list_drivers(
     db: asyncpg.Connection = Depends(get_db),
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_user_with_db),
 ):
     """
     Return all users with role='driver', including their request count.
@@ -56,11 +57,24 @@ async def list_drivers(
     return [dict(row) for row in rows]
 
 
+@router.get("/users/stats")
+async def driver_stats(user: dict = Depends(get_current_user)):
+    """
+    Dashboard aggregates (signups per day by role, drivers with/without number
+    plates, driver request-count distribution).
+    Served from the background-refreshed snapshot in app.core.stats_cache;
+    never queries users or service_requests on the request path.
+    """
+    if stats_cache.snapshot_json is None:
+        raise HTTPException(status_code=503, detail="Stats not ready yet")
+    return Response(content=stats_cache.snapshot_json, media_type="application/json")
+
+
 @router.patch("/users/me")
 async def update_my_profile(
     body: UserProfileUpdate,
     db: asyncpg.Connection = Depends(get_db),
-    user: dict = Depends(get_current_user),
+    user: dict = Depends(get_current_user_with_db),
 ):
     """
     Update the authenticated driver's profile (full_name, number_plate).
@@ -87,5 +101,8 @@ async def update_my_profile(
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
 
+    if "number_plate" in updates:
+        stats_cache.note_profile_update(row["id"], row["number_plate"])
+
     logger.info(f"✅ [PATCH /users/me] Updated profile for user_id={user['id']}")
     return dict(row)
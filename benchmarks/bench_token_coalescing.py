@@ -0,0 +1,127 @@
+"""
+Concurrency benchmark for coalesced token-validation lookups.
+
+Simulates page-load bursts: each burst fires `--fanout` parallel token
+validations for each of `--users` users, against a fake connection with
+`--latency` seconds of query time, through the real `db_connection()`
+on a fake pool of `--pool-size` connections.
+
+Compares a pooled `fetchrow` per call with `_fetch_user_row`, the
+single-flight lookup used by `get_current_user`, where only the leader
+borrows a connection. Besides query counts it reports pool acquires, the
+peak number of slots in use, and total slot hold time. No database needed.
+
+Usage:
+    python benchmarks/bench_token_coalescing.py --users 20 --fanout 8 --bursts 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.main  # noqa: E402
+from app.routers.auth import USER_BY_ID_QUERY, _fetch_user_row, _user_lookups, db_connection  # noqa: E402
+
+
+class FakeConnection:
+    def __init__(self, stats: dict, latency: float):
+        self.stats = stats
+        self.latency = latency
+
+    async def fetchrow(self, query, user_id):
+        self.stats["queries"] += 1
+        await asyncio.sleep(self.latency)
+        return {"id": user_id, "phone": f"+2567{user_id:08d}", "full_name": None, "role": "driver", "number_plate": None}
+
+
+class FakePool:
+    """Stands in for app.main.pool; tracks how many slots are in use."""
+
+    def __init__(self, size: int, conn: FakeConnection):
+        self._slots = asyncio.Semaphore(size)
+        self.conn = conn
+        self.acquires = 0
+        self.in_use = 0
+        self.peak = 0
+        self.held_seconds = 0.0
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._slots:
+            self.acquires += 1
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+            start = time.perf_counter()
+            try:
+                yield self.conn
+            finally:
+                self.held_seconds += time.perf_counter() - start
+                self.in_use -= 1
+
+
+async def run(mode: str, args) -> dict:
+    stats = {"queries": 0}
+    pool = FakePool(args.pool_size, FakeConnection(stats, args.latency))
+    app.main.pool = pool
+    latencies = []
+
+    async def validate(user_id: int):
+        start = time.perf_counter()
+        if mode == "coalesced":
+            await _fetch_user_row(user_id)
+        else:
+            async with db_connection() as conn:
+                await conn.fetchrow(USER_BY_ID_QUERY, user_id)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(args.bursts):
+        await asyncio.gather(*(
+            validate(user_id)
+            for user_id in range(1, args.users + 1)
+            for _ in range(args.fanout)
+        ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "lookups": len(latencies),
+        "queries": stats["queries"],
+        "acquires": pool.acquires,
+        "peak_slots": pool.peak,
+        "slot_seconds": pool.held_seconds,
+        "elapsed": elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main(args):
+    results = [await run("naive", args), await run("coalesced", args)]
+    print(
+        f"{'mode':>10} {'lookups':>8} {'queries':>8} {'saved':>7} {'acquires':>9} {'peak':>5} "
+        f"{'slot s':>7} {'elapsed s':>10} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for r in results:
+        saved = 1 - r["queries"] / r["lookups"]
+        print(
+            f"{r['mode']:>10} {r['lookups']:>8} {r['queries']:>8} {saved:>6.0%} {r['acquires']:>9} "
+            f"{r['peak_slots']:>5} {r['slot_seconds']:>7.2f} {r['elapsed']:>10.3f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}"
+        )
+    print(f"single-flight counters: calls={_user_lookups.calls} coalesced={_user_lookups.coalesced}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=8, help="parallel validations per user per burst")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated query time in seconds")
+    parser.add_argument("--pool-size", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
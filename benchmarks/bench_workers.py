@@ -0,0 +1,205 @@
+"""
+Worker scaling benchmark for /auth/me and /auth/login.
+
+Starts the service with 1..N uvicorn workers against a real Postgres
+(DATABASE_URL must be set, SECRET_KEY too) and reports requests/sec for:
+
+- GET /auth/me     with a valid bearer token
+- POST /auth/login with pre-issued OTPs (one per phone, consumed once)
+
+Load comes from `--clients` separate client processes, so a single Python
+client doesn't saturate before the server does. The clients share the
+machine with the server; give the box spare cores (or shrink `--workers`)
+for clean numbers at high worker counts.
+
+Every run starts by deleting the benchmark's own phone numbers from `users`
+and `otp_codes`, so each run takes the same new-user INSERT path on login.
+Point DATABASE_URL at a disposable database, never production.
+
+SMS is forced to the console provider in the server; no real SMS are sent.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --clients 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import asyncpg
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    # Never send real SMS from a benchmark: the bench phones are real numbers
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), ENV="development", SMS_PROVIDERS="console")
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+
+
+async def wait_healthy(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become healthy")
+
+
+def bench_phone(i: int) -> str:
+    # Valid-looking numbers only; they may belong to real subscribers, hence SMS_PROVIDERS=console
+    return f"+2567999{i:05d}"
+
+
+async def reset_bench_users(phones: list) -> None:
+    conn = await asyncpg.connect(os.getenv("DATABASE_URL"))
+    try:
+        await conn.execute("DELETE FROM users WHERE phone = ANY($1::text[])", phones)
+        await conn.execute("DELETE FROM otp_codes WHERE phone = ANY($1::text[])", phones)
+    finally:
+        await conn.close()
+
+
+async def issue_otp(client: httpx.AsyncClient, phone: str) -> str:
+    resp = await client.post("/auth/send-otp", json={"phone": phone})
+    resp.raise_for_status()
+    return resp.json()["otp"]
+
+
+# ────────────────────────────── CLIENT PROCESSES ──────────────────────────────
+
+async def _client(kind: str, base_url: str, payload, concurrency: int, duration: float, start_at: float):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        done = errors = 0
+        stop_at = time.monotonic() + duration
+
+        async def me_worker():
+            nonlocal done, errors
+            while time.monotonic() < stop_at:
+                resp = await client.get("/auth/me", headers=payload)
+                if resp.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        async def login_worker():
+            nonlocal done, errors
+            while payload:
+                phone, otp = payload.pop()
+                resp = await client.post("/auth/login", json={"phone": phone, "otp": otp})
+                if resp.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        worker = me_worker if kind == "me" else login_worker
+        start = time.time()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return done, errors, start, time.time()
+
+
+def _client_process(*args):
+    return asyncio.run(_client(*args))
+
+
+def run_clients(pool: ProcessPoolExecutor, kind: str, base_url: str, payloads: list, concurrency: int, duration: float):
+    """Run one client process per payload in parallel; return (req/s, errors)."""
+    per_client = max(1, concurrency // len(payloads))
+    start_at = time.time() + 1.0  # let every process get ready before the clock starts
+    futures = [
+        pool.submit(_client_process, kind, base_url, payload, per_client, duration, start_at)
+        for payload in payloads
+    ]
+    results = [f.result() for f in futures]
+    done = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    elapsed = max(r[3] for r in results) - min(r[2] for r in results)
+    return done / elapsed, errors
+
+
+# ────────────────────────────── SCENARIOS ──────────────────────────────
+
+async def bench_me(pool: ProcessPoolExecutor, base_url: str, args) -> tuple:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        phone = bench_phone(0)
+        otp = await issue_otp(client, phone)
+        token = (await client.post("/auth/login", json={"phone": phone, "otp": otp})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    return run_clients(pool, "me", base_url, [headers] * args.clients, args.concurrency, args.duration)
+
+
+async def bench_login(pool: ProcessPoolExecutor, base_url: str, args) -> tuple:
+    # Issue every OTP up front so only /auth/login is timed
+    phones = [bench_phone(i) for i in range(1, args.logins + 1)]
+    sem = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def issue(phone):
+            async with sem:
+                return phone, await issue_otp(client, phone)
+
+        pending = list(await asyncio.gather(*(issue(p) for p in phones)))
+
+    chunks = [pending[i::args.clients] for i in range(args.clients)]
+    return run_clients(pool, "login", base_url, chunks, args.concurrency, 0)
+
+
+async def main(args):
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("DATABASE_URL must point at a disposable Postgres database")
+
+    bench_phones = [bench_phone(i) for i in range(args.logins + 1)]
+    results = []
+    with ProcessPoolExecutor(max_workers=args.clients) as pool:
+        for workers in sorted(set(args.workers)):
+            proc = start_server(workers, args.port)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                await wait_healthy(base_url)
+                # Fresh users every run, so login always takes the INSERT path
+                await reset_bench_users(bench_phones)
+                me_rps, me_errors = await bench_me(pool, base_url, args)
+                login_rps, login_errors = await bench_login(pool, base_url, args)
+                results.append((workers, me_rps, login_rps, me_errors + login_errors))
+            finally:
+                proc.terminate()
+                proc.wait()
+        await reset_bench_users(bench_phones)
+
+    base_me, base_login = results[0][1], results[0][2]
+    print(f"cpus={os.cpu_count()} clients={args.clients} concurrency={args.concurrency}")
+    print(f"{'workers':>8} {'/auth/me rps':>14} {'scale':>7} {'/auth/login rps':>16} {'scale':>7} {'errors':>7}")
+    for workers, me_rps, login_rps, errors in results:
+        print(
+            f"{workers:>8} {me_rps:>14.0f} {me_rps / base_me:>6.2f}x "
+            f"{login_rps:>16.0f} {login_rps / base_login:>6.2f}x {errors:>7}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--clients", type=int, default=4, help="client processes generating load")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of /auth/me load per run")
+    parser.add_argument("--logins", type=int, default=2000, help="logins timed per run (max 99999)")
+    parser.add_argument("--concurrency", type=int, default=64, help="in-flight requests across all clients")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
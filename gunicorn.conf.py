@@ -0,0 +1,48 @@
+# motofix-auth-service: gunicorn.conf.py
+#
+# Multi-worker serving profile:
+#     gunicorn app.main:app -c gunicorn.conf.py
+#
+# Worker count comes from WEB_CONCURRENCY (defaults to one worker per core).
+# Each worker needs at least 2 connections (one pooled, one for the stats
+# refresher), so the count is capped at DB_POOL_MAX_TOTAL // 2. It is
+# exported back into the environment so each worker can size its asyncpg
+# pool as DB_POOL_MAX_TOTAL // WEB_CONCURRENCY - 1 (see app.core.workers).
+
+import logging
+import multiprocessing
+import os
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    def load_dotenv(*args, **kwargs):
+        logging.warning("python-dotenv not installed; skipping load_dotenv()")
+
+# The master sizes the worker count from DB_POOL_MAX_TOTAL, which may live in .env
+load_dotenv()
+
+from app.core.workers import max_workers
+
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Never start more workers than the Postgres connection budget can serve
+if workers > max_workers():
+    logging.getLogger("gunicorn.error").warning(
+        "Capping workers at %d (from %d) to stay within DB_POOL_MAX_TOTAL", max_workers(), workers
+    )
+    workers = max_workers()
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Don't preload: asyncpg pools must be created inside each worker's event loop
+preload_app = False
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
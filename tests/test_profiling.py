@@ -0,0 +1,170 @@
+import os
+
+import asyncpg
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import app.main
+from app.core import profiling
+from app.routers import admin
+from app.routers.auth import get_db
+
+
+def make_client(sample_rate=0.0):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def work():
+        with profiling.span("create_jwt"):
+            sum(range(1000))
+        return {"profiled": profiling.is_active()}
+
+    app.add_middleware(profiling.ProfilingMiddleware, sample_rate=sample_rate)
+    app.include_router(admin.router)
+    return TestClient(app)
+
+
+def test_unprofiled_request_records_nothing(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    resp = make_client().get("/work")
+    assert resp.json() == {"profiled": False}
+    assert len(profiling.profiles) == 0
+
+
+def test_admin_header_triggers_profile_and_download(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    client = make_client()
+    headers = {"X-Profile-Token": "secret"}
+
+    assert client.get("/work", headers=headers).json() == {"profiled": True}
+
+    listed = client.get("/admin/profiles", headers=headers).json()
+    assert len(listed) == 1 and listed[0]["path"] == "/work"
+    assert listed[0]["status_code"] == 200
+
+    detail = client.get(f"/admin/profiles/{listed[0]['id']}", headers=headers).json()
+    assert [s["name"] for s in detail["spans"]] == ["create_jwt"]
+    assert detail["pstats"]
+
+    raw = client.get(f"/admin/profiles/{listed[0]['id']}/pstats", headers=headers)
+    assert raw.status_code == 200 and raw.content
+
+
+def test_wrong_token_is_not_profiled_and_cannot_download(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    client = make_client()
+    headers = {"X-Profile-Token": "nope"}
+
+    assert client.get("/work", headers=headers).json() == {"profiled": False}
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+
+
+def test_sample_rate_profiles_without_header(monkeypatch):
+    monkeypatch.delenv("PROFILE_ADMIN_TOKENS", raising=False)
+    profiling.profiles.clear()
+    make_client(sample_rate=1.0).get("/work")
+    assert profiling.profiles[-1].trigger == "sample"
+
+
+def test_span_is_noop_outside_profiled_request():
+    assert profiling.span("anything") is profiling.span("other")
+
+
+def test_non_ascii_token_is_rejected_not_500(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    client = make_client()
+    headers = {"X-Profile-Token": b"\xe9"}
+
+    assert client.get("/work", headers=headers).json() == {"profiled": False}
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+
+
+def test_profile_ids_are_unique_across_workers(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    client = make_client()
+    headers = {"X-Profile-Token": "secret"}
+    client.get("/work", headers=headers)
+
+    profile_id = client.get("/admin/profiles", headers=headers).json()[0]["id"]
+    assert profile_id.startswith(f"{os.getpid()}-")
+    # Same sequence number on another worker's pid is not found here
+    other = f"{os.getpid() + 1}-{profile_id.split('-')[1]}"
+    assert client.get(f"/admin/profiles/{other}/pstats", headers=headers).status_code == 404
+
+
+def test_admin_requests_leave_buffer_unchanged(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    profiling.profiles.clear()
+    client = make_client(sample_rate=1.0)
+    headers = {"X-Profile-Token": "secret"}
+    client.get("/work", headers=headers)
+    before = list(profiling.profiles)
+
+    profile_id = client.get("/admin/profiles", headers=headers).json()[0]["id"]
+    client.get(f"/admin/profiles/{profile_id}", headers=headers)
+    client.get(f"/admin/profiles/{profile_id}/pstats", headers=headers)
+    assert list(profiling.profiles) == before
+
+
+class FakeConn:
+    async def fetchrow(self, query, *args):
+        return {"id": args[0]}
+
+    async def fetchval(self, query, *args):
+        return 1
+
+
+class FakePool:
+    """Only what the profiled branch of db_connection() uses."""
+
+    def __init__(self):
+        self.conn = FakeConn()
+        self.released = []
+
+    async def acquire(self):
+        return self.conn
+
+    async def release(self, conn):
+        self.released.append(conn)
+
+
+def test_profiled_db_connection_traces_queries_and_releases(monkeypatch):
+    monkeypatch.setenv("PROFILE_ADMIN_TOKENS", "secret")
+    pool = FakePool()
+    monkeypatch.setattr(app.main, "pool", pool, raising=False)
+    profiling.profiles.clear()
+
+    toy = FastAPI()
+
+    @toy.get("/user")
+    async def user(db: asyncpg.Connection = Depends(get_db)):
+        await db.fetchrow("SELECT * FROM users WHERE id = $1", 1)
+        return {"count": await db.fetchval("SELECT count(*) FROM users")}
+
+    @toy.get("/boom")
+    async def boom(db: asyncpg.Connection = Depends(get_db)):
+        await db.fetchval("SELECT 1")
+        raise RuntimeError("boom")
+
+    toy.add_middleware(profiling.ProfilingMiddleware)
+    client = TestClient(toy, raise_server_exceptions=False)
+    headers = {"X-Profile-Token": "secret"}
+
+    assert client.get("/user", headers=headers).json() == {"count": 1}
+    spans = [(s["name"], s["detail"]) for s in profiling.profiles[-1].spans]
+    assert spans == [
+        ("get_db acquire", None),
+        ("fetchrow", "SELECT * FROM users WHERE id = $1"),
+        ("fetchval", "SELECT count(*) FROM users"),
+    ]
+    assert pool.released == [pool.conn]
+
+    assert client.get("/boom", headers=headers).status_code == 500
+    assert [s["name"] for s in profiling.profiles[-1].spans] == ["get_db acquire", "fetchval"]
+    # The unwrapped connection goes back to the pool on the error path too
+    assert pool.released == [pool.conn, pool.conn]
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+class SlowQuery:
+    def __init__(self, delay=0.01, error=None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"id": 1, "call": self.calls}
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flight, query = SingleFlight(), SlowQuery()
+        results = await asyncio.gather(*(flight.do(1, query) for _ in range(10)))
+        assert query.calls == 1
+        assert all(r is results[0] for r in results)
+        assert flight.coalesced == 9
+
+        # Nothing is cached once the call is done
+        await flight.do(1, query)
+        assert query.calls == 2
+
+    asyncio.run(main())
+
+
+def test_different_keys_are_not_coalesced():
+    async def main():
+        flight, query = SingleFlight(), SlowQuery()
+        await asyncio.gather(flight.do(1, query), flight.do(2, query))
+        assert query.calls == 2
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_caller():
+    async def main():
+        flight, query = SingleFlight(), SlowQuery(error=RuntimeError("db down"))
+        results = await asyncio.gather(*(flight.do(1, query) for _ in range(3)), return_exceptions=True)
+        assert query.calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_hands_over_to_follower():
+    async def main():
+        flight, query = SingleFlight(), SlowQuery(delay=0.05)
+        leader = asyncio.create_task(flight.do(1, query))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(1, query))
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert (await follower)["call"] == 2
+
+    asyncio.run(main())
+
+
+def test_cancelled_follower_does_not_affect_leader():
+    async def main():
+        flight, query = SingleFlight(), SlowQuery(delay=0.05)
+        leader = asyncio.create_task(flight.do(1, query))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(1, query))
+        await asyncio.sleep(0.01)
+
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        assert (await leader)["call"] == 1
+        assert query.calls == 1
+
+    asyncio.run(main())
+
+
+class CountingPool:
+    """Fake asyncpg pool: counts acquires and serves SlowQuery rows."""
+
+    def __init__(self):
+        self.acquires = 0
+        self.query = SlowQuery()
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                pool.acquires += 1
+                return pool
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Acquire()
+
+    async def fetchrow(self, query, *args):
+        return await self.query()
+
+
+def test_only_the_leader_borrows_a_pool_connection(monkeypatch):
+    import app.main
+    from app.routers.auth import _fetch_user_row
+
+    pool = CountingPool()
+    monkeypatch.setattr(app.main, "pool", pool, raising=False)
+
+    async def main():
+        await asyncio.gather(*(_fetch_user_row(1) for _ in range(10)))
+        assert pool.acquires == 1 and pool.query.calls == 1
+
+        # A caller already holding the request's connection never takes another
+        await _fetch_user_row(1, pool)
+        assert pool.acquires == 1 and pool.query.calls == 2
+
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+import asyncio
+import threading
+
+from app.core.sms import CircuitBreaker, FakeSMSProvider, SMSDispatcher, ThreadedSMSProvider
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingSMSProvider(ThreadedSMSProvider):
+    """Blocking SDK stand-in: every send hangs until `release` is set."""
+
+    name = "blocking"
+
+    def __init__(self, timeout, max_threads):
+        super().__init__(timeout, max_threads)
+        self.release = threading.Event()
+        self.started = 0
+
+    def _send_blocking(self, phone, message):
+        self.started += 1
+        self.release.wait()
+
+
+def make_dispatcher(primary, secondary, clock):
+    return SMSDispatcher(
+        [primary, secondary],
+        breaker_factory=lambda: CircuitBreaker(
+            window_size=4, min_calls=2, failure_rate_threshold=0.5, cooldown_seconds=10, clock=clock
+        ),
+    )
+
+
+def test_fails_over_to_secondary_on_error():
+    primary = FakeSMSProvider("primary", error_rate=1.0)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, FakeClock())
+
+    assert asyncio.run(dispatcher.send("+256700000001", "hi")) == "secondary"
+    assert secondary.sent == [("+256700000001", "hi")]
+    assert dispatcher.failed["primary"] == 1
+
+
+def test_slow_provider_is_cut_off_by_timeout():
+    primary = FakeSMSProvider("primary", timeout=0.01, latency=1.0)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, FakeClock())
+
+    assert asyncio.run(dispatcher.send("+256700000001", "hi")) == "secondary"
+    assert primary.sent == []
+
+
+def test_breaker_opens_then_probes_and_closes():
+    clock = FakeClock()
+    primary = FakeSMSProvider("primary", error_rate=1.0)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, clock)
+    breaker = dispatcher.breakers["primary"]
+
+    async def send_many(n):
+        for _ in range(n):
+            await dispatcher.send("+256700000001", "hi")
+
+    asyncio.run(send_many(2))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # While open, the primary is not called at all
+    asyncio.run(send_many(3))
+    assert dispatcher.failed["primary"] == 2
+
+    # After the cooldown a single successful probe closes the breaker
+    primary.error_rate = 0.0
+    clock.now = 11
+    assert asyncio.run(dispatcher.send("+256700000001", "hi")) == "primary"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window_size=4, min_calls=2, cooldown_seconds=10, clock=clock)
+    breaker.record_failure(breaker.allow_request())
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 11
+    probe = breaker.allow_request()
+    assert probe is not None and breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() is None  # only one probe at a time
+    breaker.record_failure(probe)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_in_flight_failures_do_not_reopen_or_extend_cooldown():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window_size=20, min_calls=5, cooldown_seconds=10, clock=clock)
+    tickets = [breaker.allow_request() for _ in range(20)]
+
+    for i, ticket in enumerate(tickets):
+        clock.now = 20 + i
+        breaker.record_failure(ticket)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 1
+    # Opened by the 5th failure; stragglers don't push the cooldown out
+    clock.now = 34
+    assert breaker.allow_request() is not None
+
+
+def test_late_success_from_closed_call_is_not_a_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window_size=4, min_calls=2, cooldown_seconds=10, clock=clock)
+    straggler = breaker.allow_request()
+    breaker.record_failure(breaker.allow_request())
+    breaker.record_failure(breaker.allow_request())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 11
+    probe = breaker.allow_request()
+    breaker.record_success(straggler)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request() is None  # probe slot still taken
+
+    breaker.record_success(probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_concurrent_sends_open_breaker_once():
+    clock = FakeClock()
+    primary = FakeSMSProvider("primary", latency=0.01, error_rate=1.0)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, clock)
+
+    async def burst():
+        return await asyncio.gather(*(dispatcher.send("+256700000001", "hi") for _ in range(20)))
+
+    assert set(asyncio.run(burst())) == {"secondary"}
+    breaker = dispatcher.breakers["primary"]
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 1
+
+
+def test_concurrent_sends_during_half_open_use_one_probe():
+    clock = FakeClock()
+    primary = FakeSMSProvider("primary", latency=0.01, error_rate=1.0)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, clock)
+    breaker = dispatcher.breakers["primary"]
+
+    async def burst():
+        return await asyncio.gather(*(dispatcher.send("+256700000001", "hi") for _ in range(10)))
+
+    asyncio.run(burst())
+    primary.error_rate = 0.0
+    clock.now = 11
+    results = asyncio.run(burst())
+
+    assert results.count("primary") == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.times_opened == 1
+
+
+def test_no_provider_available_returns_none():
+    dispatcher = make_dispatcher(
+        FakeSMSProvider("primary", error_rate=1.0), FakeSMSProvider("secondary", error_rate=1.0), FakeClock()
+    )
+    assert asyncio.run(dispatcher.send("+256700000001", "hi")) is None
+    assert dispatcher.snapshot()["undelivered"] == 1
+
+
+def test_hung_blocking_sdk_stays_on_its_own_threads():
+    primary = BlockingSMSProvider(timeout=0.05, max_threads=2)
+    secondary = FakeSMSProvider("secondary")
+    dispatcher = make_dispatcher(primary, secondary, FakeClock())
+
+    async def main():
+        results = await asyncio.gather(*(dispatcher.send("+256700000001", "hi") for _ in range(10)))
+        # The loop's default executor is still free for DNS / asyncpg.connect
+        assert await asyncio.wait_for(asyncio.to_thread(int, "7"), timeout=1) == 7
+        return results
+
+    try:
+        assert set(asyncio.run(main())) == {"secondary"}
+        # Timed-out sends queue behind the hung ones instead of spawning threads
+        assert primary.started == 2
+    finally:
+        primary.release.set()
+        primary._executor.shutdown(wait=True)
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import stats_cache
+from app.core.stats_cache import StatsCache
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class FakeConn:
+    """Mimics the two watermark queries the stats cache issues."""
+
+    def __init__(self):
+        self.users = []
+        self.requests = []  # (customer_phone, created_at)
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        since = args[0] if args else None
+        if "FROM users" in query:
+            return [u for u in self.users if since is None or u["created_at"] > since]
+        groups = {}
+        for phone, created_at in self.requests:
+            if since is None or created_at > since:
+                count, latest = groups.get(phone, (0, created_at))
+                groups[phone] = (count + 1, max(latest, created_at))
+        return [
+            {"customer_phone": phone, "request_count": count, "latest": latest}
+            for phone, (count, latest) in groups.items()
+        ]
+
+
+def add_user(conn, user_id, role="driver", plate=None, at=T0):
+    conn.users.append({
+        "id": user_id, "phone": f"+25670000000{user_id}", "role": role,
+        "number_plate": plate, "created_at": at,
+    })
+
+
+def snapshot(cache):
+    return json.loads(cache.snapshot_json)
+
+
+def test_full_then_incremental_refresh():
+    conn = FakeConn()
+    cache = StatsCache()
+    add_user(conn, 1, plate="UAX 123A")
+    add_user(conn, 2)
+    add_user(conn, 3, role="customer")
+    conn.requests.append(("+256700000001", T0))
+
+    asyncio.run(cache.refresh(conn, full=True))
+    stats = snapshot(cache)
+    assert stats["totals"]["drivers"] == 2
+    assert stats["totals"]["drivers_with_number_plate"] == 1
+    assert stats["totals"]["drivers_with_requests"] == 1
+    assert stats["signups_by_day"]["2026-10-01"] == {"driver": 2, "customer": 1}
+
+    later = T0 + timedelta(days=1)
+    add_user(conn, 4, at=later)
+    conn.requests += [("+256700000001", later), ("+256700000002", later)]
+    asyncio.run(cache.refresh(conn))
+
+    # The incremental pass only asks for rows past the watermarks
+    assert all(args == (T0,) for _, args in conn.queries[-2:])
+    stats = snapshot(cache)
+    assert stats["totals"]["drivers"] == 3
+    assert stats["signups_by_day"]["2026-10-02"] == {"driver": 1}
+    assert stats["driver_request_count_distribution"] == {"0": 1, "1": 1, "2-5": 1, "6-10": 0, "11+": 0}
+
+
+def test_profile_update_is_reflected_immediately():
+    conn = FakeConn()
+    cache = StatsCache()
+    add_user(conn, 1)
+    asyncio.run(cache.refresh(conn, full=True))
+    assert snapshot(cache)["totals"]["drivers_without_number_plate"] == 1
+
+    cache.note_profile_update(1, "UAX 123A")
+    assert snapshot(cache)["totals"]["drivers_with_number_plate"] == 1
+
+
+def test_refresher_uses_own_connection_and_closes_it_on_cancel(monkeypatch):
+    conn = FakeConn()
+    conn.closed = False
+    conn.is_closed = lambda: conn.closed
+
+    async def close():
+        conn.closed = True
+
+    async def connect(dsn):
+        return conn
+
+    conn.close = close
+    add_user(conn, 1)
+    monkeypatch.setattr(stats_cache.asyncpg, "connect", connect)
+    monkeypatch.setattr(stats_cache, "STATS_STARTUP_JITTER_SECONDS", 0)
+
+    async def main():
+        cache = StatsCache()
+        task = asyncio.create_task(cache.run("postgresql://unused"))
+        while cache.snapshot_json is None:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return cache
+
+    assert snapshot(asyncio.run(main()))["totals"]["drivers"] == 1
+    assert conn.closed
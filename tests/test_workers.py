@@ -0,0 +1,30 @@
+from app.core.workers import max_workers, pool_size_per_worker, worker_count
+
+
+def test_pool_budget_is_split_across_workers(monkeypatch):
+    monkeypatch.setenv("DB_POOL_MAX_TOTAL", "20")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert worker_count() == 4
+    # 5 connections per worker: 4 in the pool + 1 for the stats refresher
+    assert pool_size_per_worker() == 4
+
+
+def test_each_worker_gets_at_least_one_connection(monkeypatch):
+    monkeypatch.setenv("DB_POOL_MAX_TOTAL", "2")
+    monkeypatch.setenv("WEB_CONCURRENCY", "8")
+    assert pool_size_per_worker() == 1
+
+
+def test_single_worker_by_default(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.delenv("DB_POOL_MAX_TOTAL", raising=False)
+    assert worker_count() == 1
+    assert pool_size_per_worker() == 9
+
+
+def test_more_workers_than_budget_is_flagged(monkeypatch, caplog):
+    monkeypatch.setenv("DB_POOL_MAX_TOTAL", "4")
+    monkeypatch.setenv("WEB_CONCURRENCY", "6")
+    assert max_workers() == 2
+    assert pool_size_per_worker() == 1
+    assert "exceeding the budget" in caplog.text